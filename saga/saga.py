@@ -1,3 +1,4 @@
+import linecache
 
 
 class SagaError(BaseException):
@@ -18,15 +19,16 @@ class Action(object):
     """
     Groups an action with its corresponding compensation. For internal use.
     """
+    __slots__ = ('_action', '_compensation')
+
     def __init__(self, action, compensation):
         """
 
         :param action: Callable a function executed as the action
         :param compensation: Callable a function that reverses the effects of action
         """
-        self.__kwargs = None
-        self.__action = action
-        self.__compensation = compensation
+        self._action = action
+        self._compensation = compensation
 
     def act(self, **kwargs):
         """
@@ -36,18 +38,151 @@ class Action(object):
                             return values of the previous action
         :return: dict optional return value of this action
         """
-        self.__kwargs = kwargs
-        return self.__action(**kwargs)
+        if kwargs:
+            return self._action(**kwargs)
+        return self._action()
 
-    def compensate(self):
+    def compensate(self, **kwargs):
         """
         Execute the compensation.
+
+        :param kwargs: dict the kwargs this action was executed with
         :return: None
         """
-        if self.__kwargs:
-            self.__compensation(**self.__kwargs)
+        if kwargs:
+            self._compensation(**kwargs)
         else:
-            self.__compensation()
+            self._compensation()
+
+
+# sagas with more actions than this run through _execute_loop instead of generated straight-line code
+_MAX_UNROLLED_ACTIONS = 32
+
+_unrolled_executors = {}
+
+# interpreter control flow, propagated as is instead of being compensated or collected
+_UNCOMPENSATED_EXCEPTIONS = (KeyboardInterrupt, SystemExit)
+
+
+def _execute_loop(actions, run_compensations):
+    """
+    Execute actions one after the other, passing each return value as kwargs to the next action.
+
+    :param actions: tuple[Callable] the actions to execute
+    :param run_compensations: Callable compensates all actions up to and including the given index, using the kwargs
+                              each of them was called with
+    :return: the first action return value that is neither None nor a dict, None if there was none
+    """
+    saved_kwargs = [None] * len(actions)
+    kwargs = None
+    try:
+        for action_index, action in enumerate(actions):
+            saved_kwargs[action_index] = kwargs
+            result = action(**kwargs) if kwargs else action()
+            if result is None or result.__class__ is dict:
+                kwargs = result
+            else:
+                return result
+    except _UNCOMPENSATED_EXCEPTIONS:
+        raise
+    except BaseException as e:
+        raise SagaError(e, run_compensations(action_index, saved_kwargs))
+
+
+def _executor(action_count):
+    """
+    Returns a function that behaves like _execute_loop for exactly action_count actions.
+    For 1 to _MAX_UNROLLED_ACTIONS actions the loop is unrolled into straight-line code, which is generated once
+    per action count and shared by all sagas of that length.
+
+    :param action_count: int
+    :return: Callable
+    """
+    if not 0 < action_count <= _MAX_UNROLLED_ACTIONS:
+        return _execute_loop
+    try:
+        execute, filename, source_lines = _unrolled_executors[action_count]
+    except KeyError:
+        pass
+    else:
+        # restore the source after linecache.clearcache() so tracebacks keep showing it
+        if filename not in linecache.cache:
+            linecache.cache[filename] = source_lines
+        return execute
+
+    lines = [
+        'def execute(actions, run_compensations):',
+        '    saved_kwargs = [None] * {}'.format(action_count),
+        '    kwargs = None',
+        '    try:',
+    ]
+    for action_index in range(action_count):
+        lines.extend(line.format(action_index) for line in (
+            '        action_index = {0}',
+            '        saved_kwargs[{0}] = kwargs',
+            '        result = actions[{0}](**kwargs) if kwargs else actions[{0}]()',
+            '        if result is None or result.__class__ is dict:',
+            '            kwargs = result',
+            '        else:',
+            '            return result',
+        ))
+    lines.extend((
+        '    except _UNCOMPENSATED_EXCEPTIONS:',
+        '        raise',
+        '    except BaseException as e:',
+        '        raise SagaError(e, run_compensations(action_index, saved_kwargs))',
+    ))
+
+    source = '\n'.join(lines) + '\n'
+    filename = '<saga executor for {} actions>'.format(action_count)
+    # register the generated source so tracebacks through it show its lines
+    source_lines = (len(source), None, source.splitlines(True), filename)
+    linecache.cache[filename] = source_lines
+    namespace = {'SagaError': SagaError, '_UNCOMPENSATED_EXCEPTIONS': _UNCOMPENSATED_EXCEPTIONS}
+    exec(compile(source, filename, 'exec'), namespace)
+    _unrolled_executors[action_count] = (namespace['execute'], filename, source_lines)
+    return namespace['execute']
+
+
+def _memoized_action(action, action_index, cache_key, cache):
+    """
+    Wraps action so its return value is recorded in cache and reused while the cache key of its kwargs stays the same.
+    Only the result for the latest key is kept, and results that are neither None nor a dict are not recorded.
+
+    :param action: Callable
+    :param action_index: int position of action in its saga
+    :param cache_key: Callable computes a key, compared with ==, from the kwargs dict action is called with
+    :param cache: dict the saga's cache of (key, return value) by action index
+    :return: Callable
+    """
+    def memoized_action(**kwargs):
+        key = cache_key(kwargs)
+        cached = cache.get(action_index)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        result = action(**kwargs) if kwargs else action()
+        if result is None or result.__class__ is dict:
+            cache[action_index] = (key, result)
+        return result
+    return memoized_action
+
+
+def _evicting_compensation(compensation, action_index, cache):
+    """
+    Wraps compensation so it discards the recorded return value of its action, whose effects it reverses.
+
+    :param compensation: Callable
+    :param action_index: int position of the compensated action in its saga
+    :param cache: dict the saga's cache of (key, return value) by action index
+    :return: Callable
+    """
+    def evicting_compensation(**kwargs):
+        cache.pop(action_index, None)
+        if kwargs:
+            compensation(**kwargs)
+        else:
+            compensation()
+    return evicting_compensation
 
 
 class Saga(object):
@@ -59,48 +194,97 @@ class Saga(object):
     While executing compensations possible Exceptions are recorded and raised wrapped in a SagaException once all
     compensations have been executed.
     """
+    __slots__ = ('_actions', '_compensations', '_cache')
+
     def __init__(self, actions):
         """
-        :param actions: list[Action]
+        :param actions: Iterable[Action]
         """
-        self.actions = actions
+        actions = tuple(actions)
+        self.__assign(tuple(action.act for action in actions), tuple(action.compensate for action in actions))
 
-    def execute(self):
+    @classmethod
+    def from_pairs(cls, pairs):
         """
-        Execute this Saga.
-        :return: None
+        Create a Saga from (action, compensation) pairs in one go, without a SagaBuilder.
+
+        :param pairs: Iterable[tuple[Callable, Callable]] actions in execution order, each with its compensation
+        :return: Saga
         """
-        kwargs = {}
-        for action_index in range(len(self.actions)):
-            try:
-                kwargs = self.__get_action(action_index).act(**kwargs) or {}
-            except BaseException as e:
-                compensation_exceptions = self.__run_compensations(action_index)
-                raise SagaError(e, compensation_exceptions)
+        pairs = tuple(pairs)
+        return cls._from_raw(tuple(action for action, _ in pairs), tuple(compensation for _, compensation in pairs))
 
-            if type(kwargs) is not dict:
-                raise TypeError('action return type should be dict or None but is {}'.format(type(kwargs)))
+    @classmethod
+    def _from_raw(cls, actions, compensations, cache_keys=None):
+        """
+        Create a Saga directly from plain callables, without wrapping each pair in an Action.
 
-    def __get_action(self, index):
+        :param actions: tuple[Callable] the actions in execution order
+        :param compensations: tuple[Callable] the compensation for each action, same order as actions
+        :param cache_keys: tuple[Callable|None] optional cache key function for each action, see SagaBuilder.action
+        :return: Saga
         """
-        Returns an action by index.
+        if len(actions) != len(compensations):
+            raise ValueError('got {} actions but {} compensations'.format(len(actions), len(compensations)))
+        saga = cls.__new__(cls)
+        saga.__assign(actions, compensations, cache_keys)
+        return saga
 
-        :param index: int
-        :return: Action
+    def __assign(self, actions, compensations, cache_keys=None):
+        """
+        :param actions: tuple[Callable]
+        :param compensations: tuple[Callable]
+        :param cache_keys: tuple[Callable|None]
+        :return: None
         """
-        return self.actions[index]
+        self._cache = {}
+        if cache_keys and any(cache_keys):
+            cache = self._cache
+            actions = tuple(
+                _memoized_action(action, index, cache_key, cache) if cache_key else action
+                for index, (action, cache_key) in enumerate(zip(actions, cache_keys)))
+            compensations = tuple(
+                _evicting_compensation(compensation, index, cache) if cache_key else compensation
+                for index, (compensation, cache_key) in enumerate(zip(compensations, cache_keys)))
+        self._actions = actions
+        self._compensations = compensations
+        # generate the executor now rather than on the first execute, it is looked up again from the shared cache
+        # there instead of being kept on the instance, which would make the saga unpicklable
+        _executor(len(actions))
 
-    def __run_compensations(self, last_action_index):
+    def execute(self):
         """
-        :param last_action_index: int
+        Execute this Saga.
         :return: None
         """
-        compensation_exceptions = []
-        for compensation_index in range(last_action_index, -1, -1):
+        actions = self._actions
+        result = _executor(len(actions))(actions, self.__run_compensations)
+        if result is not None:
+            # raised outside of the executor so a wrong return type is not compensated
+            raise TypeError('action return type should be dict or None but is {}'.format(type(result)))
+
+    def __run_compensations(self, last_action_index, saved_kwargs):
+        """
+        :param last_action_index: int
+        :param saved_kwargs: list[dict|None] the kwargs each action up to last_action_index was called with
+        :return: list[BaseException]
+        """
+        # sized for the worst case of every compensation failing, truncated to the actual failures at the end
+        compensation_exceptions = [None] * (last_action_index + 1)
+        failed_count = 0
+        for compensation, kwargs in zip(self._compensations[last_action_index::-1],
+                                        saved_kwargs[last_action_index::-1]):
             try:
-                self.__get_action(compensation_index).compensate()
+                if kwargs:
+                    compensation(**kwargs)
+                else:
+                    compensation()
+            except _UNCOMPENSATED_EXCEPTIONS:
+                raise
             except BaseException as ex:
-                compensation_exceptions.append(ex)
+                compensation_exceptions[failed_count] = ex
+                failed_count += 1
+        del compensation_exceptions[failed_count:]
         return compensation_exceptions
 
 
@@ -109,22 +293,29 @@ class SagaBuilder(object):
     Build a Saga.
     """
     def __init__(self):
-        self.actions = []
+        self._actions = []
+        self._compensations = []
+        self._cache_keys = []
 
     @staticmethod
     def create():
         return SagaBuilder()
 
-    def action(self, action, compensation):
+    def action(self, action, compensation, cache_key=None):
         """
         Add an action and a corresponding compensation.
 
         :param action: Callable an action to be executed
         :param compensation: Callable an action that reverses the effects of action
+        :param cache_key: Callable optional, marks action as idempotent. Called with the kwargs dict of action, it
+                          returns a key that is compared with ==. When the same Saga is executed again and the key is
+                          equal to the previous one, the recorded return value is reused instead of calling action.
+                          Compensating action discards the recorded value.
         :return: SagaBuilder
         """
-        action = Action(action, compensation)
-        self.actions.append(action)
+        self._actions.append(action)
+        self._compensations.append(compensation)
+        self._cache_keys.append(cache_key)
         return self
 
     def build(self):
@@ -132,4 +323,4 @@ class SagaBuilder(object):
         Returns a new Saga ready to execute all actions passed to the builder.
         :return: Saga
         """
-        return Saga(self.actions)
+        return Saga._from_raw(tuple(self._actions), tuple(self._compensations), tuple(self._cache_keys))
@@ -1,6 +1,18 @@
+import linecache
+import pickle
+import traceback
 from unittest import TestCase
 from unittest.mock import Mock
 from . import Saga, Action, SagaError, SagaBuilder
+from .saga import _MAX_UNROLLED_ACTIONS
+
+
+def pickled_action(counter=0):
+    return {'counter': counter + 1}
+
+
+def pickled_compensation(counter=0):
+    pass
 
 
 class SagaTest(TestCase):
@@ -189,6 +201,131 @@ class SagaTest(TestCase):
         self.assertEqual(action.act.call_count, 1)
         self.assertEqual(action.compensate.call_count, 0)
 
+    def test_action_return_value_is_falsy_but_not_dict(self):
+        action = Mock(spec=Action)
+        action.act.return_value = []
+
+        with self.assertRaises(TypeError):
+            (Saga([action])).execute()
+
+        self.assertEqual(action.compensate.call_count, 0)
+
+    def test_pass_return_value_to_next_action_compensation(self):
+        action1_return_value = {'return_value': 'some result'}
+        compensation2_argument = None
+
+        def action2(**kwargs):
+            raise BaseException('fail test action2')
+
+        def compensation2(**kwargs):
+            nonlocal compensation2_argument
+            compensation2_argument = kwargs
+
+        with self.assertRaises(SagaError):
+            Saga([
+                Action(lambda: action1_return_value, Mock()),
+                Action(action2, compensation2),
+            ]).execute()
+
+        self.assertDictEqual(action1_return_value, compensation2_argument)
+
+    def test_keyboard_interrupt_is_not_compensated(self):
+        for action_count in (1, _MAX_UNROLLED_ACTIONS + 1):
+            def ex():
+                raise KeyboardInterrupt()
+            actions = [Mock(spec=Action) for _ in range(action_count)]
+            for action in actions:
+                action.act.return_value = None
+            actions[-1].act = ex
+
+            with self.assertRaises(KeyboardInterrupt):
+                (Saga(actions)).execute()
+
+            for action in actions:
+                self.assertEqual(action.compensate.call_count, 0)
+
+    def test_system_exit_in_compensation_stops_compensating(self):
+        def ex():
+            raise BaseException('test_system_exit_in_compensation_action')
+
+        def com_ex():
+            raise SystemExit()
+
+        action1 = Mock(spec=Action)
+        action1.act.return_value = None
+        action2 = Mock(spec=Action)
+        action2.act = ex
+        action2.compensate = com_ex
+
+        with self.assertRaises(SystemExit):
+            (Saga([action1, action2])).execute()
+
+        self.assertEqual(action1.compensate.call_count, 0)
+
+    def test_from_pairs(self):
+        action1_return_value = {'return_value': 'some result'}
+        compensation1 = Mock()
+        compensation2_argument = None
+
+        def action2(**kwargs):
+            raise BaseException('fail test action2')
+
+        def compensation2(**kwargs):
+            nonlocal compensation2_argument
+            compensation2_argument = kwargs
+
+        with self.assertRaises(SagaError):
+            Saga.from_pairs([
+                (lambda: action1_return_value, compensation1),
+                (action2, compensation2),
+            ]).execute()
+
+        self.assertEqual(compensation1.call_count, 1)
+        self.assertDictEqual(action1_return_value, compensation2_argument)
+
+    def test_compensate_actions_given_as_generator(self):
+        compensation1 = Mock()
+
+        def action2():
+            raise BaseException('fail test action2')
+
+        with self.assertRaises(SagaError):
+            Saga(Action(action, compensation) for action, compensation in [
+                (lambda: None, compensation1),
+                (action2, Mock()),
+            ]).execute()
+
+        self.assertEqual(compensation1.call_count, 1)
+
+    def test_reject_mismatched_actions_and_compensations(self):
+        with self.assertRaises(ValueError):
+            Saga._from_raw((Mock(), Mock()), (Mock(),))
+
+    def test_traceback_shows_generated_executor_source(self):
+        def action():
+            raise ValueError('test_traceback_action')
+
+        saga = SagaBuilder.create().action(action, Mock()).build()
+        linecache.clearcache()
+        with self.assertRaises(SagaError) as context:
+            saga.execute()
+
+        formatted = ''.join(traceback.format_exception(
+            type(context.exception.action), context.exception.action, context.exception.action.__traceback__))
+        self.assertIn('result = actions[0](**kwargs) if kwargs else actions[0]()', formatted)
+
+    def test_from_pairs_iterator(self):
+        compensation1 = Mock()
+
+        def action2():
+            raise ValueError('fail test action2')
+
+        with self.assertRaises(SagaError) as context:
+            Saga.from_pairs(zip([lambda: None, action2], [compensation1, Mock()])).execute()
+
+        self.assertEqual(compensation1.call_count, 1)
+        self.assertEqual(context.exception.compensations, [])
+
 
 class SagaBuilderTest(TestCase):
     def test_execute_and_compensate(self):
@@ -260,3 +397,129 @@ class SagaBuilderTest(TestCase):
             pass
 
         self.assertDictEqual(action1_return_value, compensation2_argument)
+
+    def test_pass_return_values_and_compensate_through_many_actions(self):
+        # covers both the unrolled and the looping executor
+        for action_count in (3, _MAX_UNROLLED_ACTIONS, _MAX_UNROLLED_ACTIONS + 1):
+            compensated = []
+
+            def action(counter=0):
+                if counter == action_count - 1:
+                    raise BaseException('fail test last action')
+                return {'counter': counter + 1}
+
+            def compensation(counter=0):
+                compensated.append(counter)
+
+            builder = SagaBuilder.create()
+            for _ in range(action_count):
+                builder.action(action, compensation)
+
+            with self.assertRaises(SagaError):
+                builder.build().execute()
+
+            self.assertEqual(compensated, list(range(action_count - 1, -1, -1)))
+
+    def test_empty_saga(self):
+        SagaBuilder.create().build().execute()
+
+    def test_reuse_cached_return_value_on_re_execute(self):
+        action1_call_count = 0
+        action2_argument = None
+
+        def action1(**kwargs):
+            nonlocal action1_call_count
+            action1_call_count += 1
+            return {'return_value': 'some result'}
+
+        def action2(**kwargs):
+            nonlocal action2_argument
+            action2_argument = kwargs
+
+        saga = SagaBuilder \
+            .create() \
+            .action(action1, Mock(), cache_key=lambda kwargs: 'action1') \
+            .action(action2, Mock()) \
+            .build()
+        saga.execute()
+        saga.execute()
+
+        self.assertEqual(action1_call_count, 1)
+        self.assertDictEqual({'return_value': 'some result'}, action2_argument)
+
+    def test_compensation_discards_cached_return_value(self):
+        action1_call_count = 0
+        action2_fails = True
+
+        def action1(**kwargs):
+            nonlocal action1_call_count
+            action1_call_count += 1
+
+        def action2(**kwargs):
+            if action2_fails:
+                raise BaseException('fail test action2')
+
+        compensation1 = Mock()
+        saga = SagaBuilder \
+            .create() \
+            .action(action1, compensation1, cache_key=lambda kwargs: 'action1') \
+            .action(action2, Mock()) \
+            .build()
+        with self.assertRaises(SagaError):
+            saga.execute()
+        action2_fails = False
+        saga.execute()
+
+        self.assertEqual(action1_call_count, 2)
+        self.assertEqual(compensation1.call_count, 1)
+
+    def test_run_cached_action_again_when_key_changes(self):
+        action1_call_count = 0
+        request_id = 1
+
+        def action1(**kwargs):
+            nonlocal action1_call_count
+            action1_call_count += 1
+            return {'request_id': request_id}
+
+        saga = SagaBuilder \
+            .create() \
+            .action(lambda: None, Mock()) \
+            .action(action1, Mock(), cache_key=lambda kwargs: request_id) \
+            .build()
+        saga.execute()
+        request_id = 2
+        saga.execute()
+        saga.execute()
+        self.assertEqual(action1_call_count, 2)
+
+        # only the result for the latest key is kept
+        request_id = 1
+        saga.execute()
+        self.assertEqual(action1_call_count, 3)
+
+    def test_do_not_cache_invalid_return_value(self):
+        action_call_count = 0
+
+        def action(**kwargs):
+            nonlocal action_call_count
+            action_call_count += 1
+            return 5
+
+        saga = SagaBuilder \
+            .create() \
+            .action(action, Mock(), cache_key=lambda kwargs: 'action') \
+            .build()
+        for _ in range(2):
+            with self.assertRaises(TypeError):
+                saga.execute()
+
+        self.assertEqual(action_call_count, 2)
+
+    def test_pickle_and_execute(self):
+        for action_count in (1, _MAX_UNROLLED_ACTIONS, _MAX_UNROLLED_ACTIONS + 1):
+            builder = SagaBuilder.create()
+            for _ in range(action_count):
+                builder.action(pickled_action, pickled_compensation)
+
+            pickle.loads(pickle.dumps(builder.build())).execute()